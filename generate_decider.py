@@ -0,0 +1,122 @@
+
+# Generate wx_decider.py from the paging_wx_memory.py theory
+#
+# The W^X theory mentions no concrete address: va only enters a query
+# through its page number binding and the page alignment of va_val. So
+# whether an access can be granted is the same for every page, and z3 only
+# has to decide each access once. The generated module answers a query
+# with that verdict and the alignment check, without calling z3.
+# The alignment-check template is not derived from the theory: before it
+# is emitted, page_independent() checks that the theory treats addresses
+# as opaque, and generation fails if it does not.
+#
+# shell> python generate_decider.py           writes wx_decider.py
+# shell> python generate_decider.py --verify  checks wx_decider.py against z3
+
+import os
+import sys
+
+from z3 import *
+
+import paging_wx_memory as wx
+
+# (function name, access query) of every decision procedure
+ACCESSES = [
+    ("is_writable", [wx.write] + wx._WRITE_RAW),
+    ("is_executable", [wx.execute] + wx._EXEC_RAW),
+    ("is_writable_and_executable",
+     [wx.write, wx.execute] + wx._WRITE_RAW + wx._EXEC_RAW),
+]
+
+# The generated module is written next to this script, whatever the
+# current directory
+OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wx_decider.py")
+
+# Addresses the generated predicates are checked against z3 on
+VERIFY_ADDRESSES = [0x0, 0x12345000, 0x12345800, 0x12345fff, 0x23456000, 0xfffff000]
+
+HEADER = """
+# Generated by generate_decider.py from the paging_wx_memory.py theory.
+# Do not edit; rerun python generate_decider.py after changing the theory.
+
+PAGE_MASK = {:#x}
+"""
+
+PREDICATE = """
+
+def {}(va_val):
+    return {}
+"""
+
+
+# The base theory, asserted once and cloned with translate() per decision
+_TEMPLATE = SimpleSolver()
+_TEMPLATE.add(wx._THEORY)
+
+
+# Decide an access over a symbolic va, for all pages at once
+def decide(query):
+    s = _TEMPLATE.translate(main_ctx())
+    s.set('model', False)
+    s.add(query)
+    return s.check()
+
+
+# A sat verdict over a symbolic va holds for every page when addresses are
+# opaque: every 20-bit term is a constant or an uninterpreted function
+# application, and bit-vector terms are only compared with == / !=. Any
+# permutation of the pages then maps models to models. A bit-vector numeral
+# or operation (va == 5, va + 1, ULT(va, va1), ...) breaks this.
+def page_independent(assertions):
+    pending = list(assertions)
+    seen = set()
+    while pending:
+        t = pending.pop()
+        if t.get_id() in seen:
+            continue
+        seen.add(t.get_id())
+        opaque = t.decl().kind() == Z3_OP_UNINTERPRETED
+        if is_bv(t) and not opaque:
+            return False
+        if any(is_bv(c) for c in t.children()) and not (opaque or is_eq(t) or is_distinct(t)):
+            return False
+        pending.extend(t.children())
+    return True
+
+
+def generate():
+    source = HEADER.format(wx.PAGE_MASK)
+    for name, query in ACCESSES:
+        if decide(query) == sat:
+            if not page_independent(wx._THEORY + query):
+                raise ValueError("{}: the verdict may depend on the page of va".format(name))
+            body = "va_val & PAGE_MASK == 0"
+        else:
+            body = "False"
+        source += PREDICATE.format(name, body)
+    return source
+
+
+# Compare the generated predicates with z3 at concrete addresses
+def verify():
+    import wx_decider
+
+    for name, query in ACCESSES:
+        for va_val in VERIFY_ADDRESSES:
+            binding = [wx.va == wx.page_number(va_val), wx.page_aligned(va_val)]
+            expected = decide(binding + query) == sat
+            if getattr(wx_decider, name)(va_val) != expected:
+                print("{}({}) disagrees with z3".format(name, hex(va_val)))
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    if "--verify" in sys.argv:
+        if not verify():
+            sys.exit(1)
+        print("wx_decider.py agrees with z3")
+    else:
+        with open(OUTPUT, "w") as f:
+            f.write(generate())
+        print("wrote wx_decider.py")
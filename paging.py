@@ -8,41 +8,48 @@ from z3 import *
 # check physical access permission is same with page table's ro_bits, nx_bits
 # satisfied.
 
+# Addresses are page aligned, so the low 12 bits (page offset) are always
+# zero. va, pa are encoded as 20-bit page numbers (address >> 12)
+# instead of 32-bit addresses with an alignment constraint.
+
 # Define symbolic variables
-mmu1 = Function('mmu1', BitVecSort(32), BitVecSort(32))
-va = BitVec('va', 32)
-pa = BitVec('pa', 32)
+mmu1 = Function('mmu1', BitVecSort(20), BitVecSort(20))
+va = BitVec('va', 20)
+pa = BitVec('pa', 20)
 
 # Access permission on page table
-ro_bits = Function('ro_bits', BitVecSort(32), BoolSort())  # ro_bits(va) = 1 when set
-nx_bits = Function('nx_bits', BitVecSort(32), BoolSort())  # nx_bits(va) = 1 when set
+ro_bits = Function('ro_bits', BitVecSort(20), BoolSort())  # ro_bits(va) = 1 when set
+nx_bits = Function('nx_bits', BitVecSort(20), BoolSort())  # nx_bits(va) = 1 when set
 
 # Access permission on physical memory
-phy_ro = Function('phy_ro', BitVecSort(32), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
-phy_nx = Function('phy_nx', BitVecSort(32), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
+phy_ro = Function('phy_ro', BitVecSort(20), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
+phy_nx = Function('phy_nx', BitVecSort(20), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
 
 
 # Define constraints
-# Constraint 0,1,2: Virtual address maps to the same physical address in the page table
+# Constraint 0: Virtual address maps to the same physical address in the page table
 constraint0 = mmu1(va) == pa
-constraint1 = (va & 0xFFF) == 0
-constraint2 = (pa & 0xFFF) == 0
 
 # Constant 3,4: access permission (ro, nx)
-constraint3 = ro_bits(va) == phy_ro(mmu1(va))
-constraint4 = nx_bits(va) == phy_nx(mmu1(va))
+constraint3 = ro_bits(va) == phy_ro(pa)
+constraint4 = nx_bits(va) == phy_nx(pa)
+
+
+# Ackermannize the uninterpreted functions away and solve the remaining
+# pure bit-vector formula with the eager bit-blasting qfbv tactic
+_tactic = Then(Tactic('simplify'), Tactic('propagate-values'), Tactic('solve-eqs'),
+               Tactic('ackermannize_bv'),
+               If(Probe('is-qfbv'), Tactic('qfbv'), Tactic('fail')))
 
 
 def basic_mapping():
 # Create solver
-    solver = Solver()
+    solver = _tactic.solver()
+    # Only the verdict is used, so skip model construction
+    solver.set('model', False)
 
     # Add constraints to the solver
-    solver.add(constraint0)
-    solver.add(constraint1)
-    solver.add(constraint2)
-    solver.add(constraint3)
-    solver.add(constraint4)
+    solver.add(constraint0, constraint3, constraint4)
 
     # Check for satisfiability
     retVal = solver.check()
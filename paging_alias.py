@@ -10,64 +10,80 @@ from z3 import *
 # check physical access permission is same with page table's ro_bits, nx_bits
 # unsatisfiable
 
-# Define symbolic variables
-mmu1 = Function('mmu1', BitVecSort(32), BitVecSort(32))
-va = BitVec('va', 32)
-va1 = BitVec('va1', 32)  # va1 is an alias of va
-va2 = BitVec('va2', 32)
-pa = BitVec('pa', 32)
-
-# Access permission on page table
-ro_bits = Function('ro_bits', BitVecSort(32), BoolSort())  # ro_bits(va) = 1 when set
-nx_bits = Function('nx_bits', BitVecSort(32), BoolSort())  # nx_bits(va) = 1 when set
-
-# Access permission on physical memory
-phy_ro = Function('phy_ro', BitVecSort(32), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
-phy_nx = Function('phy_nx', BitVecSort(32), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
-
-
-# Define constraints
-# Constraint 0,1,2: Virtual address maps to the same physical address in the page table
-constraint0 = mmu1(va) == pa
-constraint1 = (va & 0xFFF) == 0
-constraint2 = (pa & 0xFFF) == 0
-
-# Constant 3,4: access permission (ro, nx)
-constraint3 = ro_bits(va) == phy_ro(mmu1(va))
-constraint4 = nx_bits(va) == phy_nx(mmu1(va))
-
-# Constraint 5~9: Alias mapping
-constraint5 = Distinct(va, va1, va2)
-constraint6 = mmu1(va1) == pa
-constraint7 = mmu1(va2) == pa
-constraint8 = (va1 & 0xFFF) == 0
-constraint9 = (va2 & 0xFFF) == 0
-
-# Constraint 10~13: access permission for aliases 
-constraint10 = Distinct(ro_bits(va), ro_bits(va1))
-constraint11 = ro_bits(va1) == phy_ro(mmu1(va1)) 
-constraint12 = Distinct(nx_bits(va), nx_bits(va2))
-constraint13 = nx_bits(va2) == phy_nx(mmu1(va2))
-
-def alias_mapping():
+# Addresses are page aligned, so the low 12 bits (page offset) are always
+# zero. va, pa are encoded as 20-bit page numbers (address >> 12)
+# instead of 32-bit addresses with an alignment constraint.
+
+# The theory is declared per call in a fresh Context instead of z3's global
+# default context; the Context and its declarations are freed once the call
+# returns, so repeated checks do not accumulate declarations.
+def declare(ctx):
+    # Define symbolic variables
+    mmu1 = Function('mmu1', BitVecSort(20, ctx), BitVecSort(20, ctx))
+    va = BitVec('va', 20, ctx)
+    va1 = BitVec('va1', 20, ctx)  # va1 is an alias of va
+    va2 = BitVec('va2', 20, ctx)
+    pa = BitVec('pa', 20, ctx)
+
+    # Access permission on page table
+    # The permission bits are only read at the distinct va, va1, va2 and at pa,
+    # so each read is its own Bool instead of a BoolSort-valued function
+    ro_va = Bool('ro_va', ctx)    # ro_bits(va) = 1 when set
+    ro_va1 = Bool('ro_va1', ctx)  # ro_bits(va1) = 1 when set
+    nx_va = Bool('nx_va', ctx)    # nx_bits(va) = 1 when set
+    nx_va2 = Bool('nx_va2', ctx)  # nx_bits(va2) = 1 when set
+
+    # Access permission on physical memory
+    phy_ro_pa = Bool('phy_ro_pa', ctx)  # phy_ro(pa) = 1 when pa is read-only
+    phy_nx_pa = Bool('phy_nx_pa', ctx)  # phy_nx(pa) = 1 when pa is non-executable
+
+    # Define constraints
+    # Constraint 0: Virtual address maps to the same physical address in the page table
+    constraint0 = mmu1(va) == pa
+
+    # Constant 3,4: access permission (ro, nx)
+    constraint3 = ro_va == phy_ro_pa
+    constraint4 = nx_va == phy_nx_pa
+
+    # Constraint 5: Alias mapping
+    # va1, va2 also map to pa; rather than asserting mmu1(va1) == pa and
+    # mmu1(va2) == pa, constraint 11,13 read the physical permission of pa directly
+    constraint5 = Distinct(va, va1, va2)
+
+    # Constraint 10~13: access permission for aliases 
+    # (z3py builds a != b as the two-argument Distinct(a, b); the != spelling
+    # is only for readability and gives the solver the same term)
+    constraint10 = ro_va != ro_va1
+    constraint11 = ro_va1 == phy_ro_pa 
+    constraint12 = nx_va != nx_va2
+    constraint13 = nx_va2 == phy_nx_pa
+
+    mapping = [constraint0, constraint3, constraint4]
+    alias = [constraint5, constraint10, constraint11, constraint12, constraint13]
+    return mapping, alias
+
+
+# Ackermannize the uninterpreted functions away and solve the remaining
+# pure bit-vector formula with the eager bit-blasting qfbv tactic
+def _tactic(ctx):
+    return Then(Tactic('simplify', ctx), Tactic('propagate-values', ctx), Tactic('solve-eqs', ctx),
+                Tactic('ackermannize_bv', ctx),
+                If(Probe('is-qfbv', ctx), Tactic('qfbv', ctx), Tactic('fail', ctx), ctx),
+                ctx=ctx)
+
+
+def alias_mapping(ctx=None):
+    if ctx is None:
+        ctx = Context()
+    mapping, alias = declare(ctx)
+
     # Create solver
-    solver = Solver()
+    solver = _tactic(ctx).solver()
+    # Only the verdict is used, so skip model construction
+    solver.set('model', False)
 
     # Add constraints to the solver
-    solver.add(constraint0)
-    solver.add(constraint1)
-    solver.add(constraint2)
-    solver.add(constraint3)
-    solver.add(constraint4)
-    solver.add(constraint5)
-    solver.add(constraint6)
-    solver.add(constraint7)
-    solver.add(constraint8)
-    solver.add(constraint9)
-    solver.add(constraint10)
-    solver.add(constraint11)
-    solver.add(constraint12)
-    solver.add(constraint13)
+    solver.add(*mapping, *alias)
 
     # Check for satisfiability
     retVal = solver.check()
@@ -78,15 +94,17 @@ def alias_mapping():
         
     return retVal
 
-def basic_mapping():
-    solver = Solver()
+def basic_mapping(ctx=None):
+    if ctx is None:
+        ctx = Context()
+    mapping, _ = declare(ctx)
+
+    solver = _tactic(ctx).solver()
+    # Only the verdict is used, so skip model construction
+    solver.set('model', False)
     
     # Add constraints to the solver
-    solver.add(constraint0)
-    solver.add(constraint1)
-    solver.add(constraint2)
-    solver.add(constraint3)
-    solver.add(constraint4)
+    solver.add(mapping)
     
     # Check for satisfiability
     retVal = solver.check()
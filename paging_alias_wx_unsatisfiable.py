@@ -4,203 +4,305 @@
 #
 # check W^X guarantee with alias
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from z3 import *
 
+# Addresses are page aligned, so the low 12 bits (page offset) are always
+# zero. va, pa are encoded as 20-bit page numbers (address >> PAGE_SHIFT)
+# instead of 32-bit addresses with an alignment constraint.
+PAGE_SHIFT = 12
+PAGE_MASK = (1 << PAGE_SHIFT) - 1
+
 # Define symbolic variables
-mmu1 = Function('mmu1', BitVecSort(32), BitVecSort(32))
-va = BitVec('va', 32)
-va1 = BitVec('va1', 32)  # va1 is an alias of va
-va2 = BitVec('va2', 32)
-pa = BitVec('pa', 32)
+mmu1 = Function('mmu1', BitVecSort(20), BitVecSort(20))
+va = BitVec('va', 20)
+va1 = BitVec('va1', 20)  # va1 is an alias of va
+va2 = BitVec('va2', 20)
+pa = BitVec('pa', 20)
 write = Bool('write')
 execute = Bool('execute')
 
 # Access permission on page table
-ro_bits = Function('ro_bits', BitVecSort(32), BoolSort())  # ro_bits(va) = 1 when set
-nx_bits = Function('nx_bits', BitVecSort(32), BoolSort())  # nx_bits(va) = 1 when set
+ro_bits = Function('ro_bits', BitVecSort(20), BoolSort())  # ro_bits(va) = 1 when set
+nx_bits = Function('nx_bits', BitVecSort(20), BoolSort())  # nx_bits(va) = 1 when set
 
 # Access permission on physical memory
-phy_ro = Function('phy_ro', BitVecSort(32), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
-phy_nx = Function('phy_nx', BitVecSort(32), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
+phy_ro = Function('phy_ro', BitVecSort(20), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
+phy_nx = Function('phy_nx', BitVecSort(20), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
 
 # Define constraints
-# Constraint 0,1,2: Virtual address maps to the same physical address in the page table
+# Constraint 0: Virtual address maps to the same physical address in the page table
 constraint0 = mmu1(va) == pa
-constraint1 = (va & 0xFFF) == 0
-constraint2 = (pa & 0xFFF) == 0
 
 # W^X property
-constraint_wx = Distinct(ro_bits(va), nx_bits(va))
+constraint_wx = ro_bits(va) != nx_bits(va)
 
 # Constraint 3: Virtual access permission (ro_bits) is set to physical access permission (phy_ro) when page is writable,
 # and unset when writing to virtual page
-constraint3 = Implies(write, And (ro_bits(va) == phy_ro(mmu1(va))), (ro_bits(va) == False))
+constraint3 = Implies(write, And(ro_bits(va) == phy_ro(pa), ro_bits(va) == False))
 
 
 # Constraint 4: Virtual access permission (nx_bits) is set to physical access permission (phy_nx) when executing from virtual page,
 # and unset when executing
-constraint4 = Implies(execute, And (nx_bits(va) == phy_nx(mmu1(va))), (nx_bits(va) == False))
+constraint4 = Implies(execute, And(nx_bits(va) == phy_nx(pa), nx_bits(va) == False))
 
-# Constraint 5~9: Alias mapping
+# Constraint 5: Alias mapping
+# va1, va2 also map to pa; rather than asserting mmu1(va1) == pa and
+# mmu1(va2) == pa, constraint 11,13 read the physical permission of pa directly
 constraint5 = Distinct(va, va1, va2)
-constraint6 = mmu1(va1) == pa
-constraint7 = mmu1(va2) == pa
-constraint8 = (va1 & 0xFFF) == 0
-constraint9 = (va2 & 0xFFF) == 0
 
 # Constraint 10~13: access permission for aliases 
-constraint10 = Distinct(ro_bits(va), ro_bits(va1))
-constraint11 = ro_bits(va1) == phy_ro(mmu1(va1)) 
-constraint12 = Distinct(nx_bits(va), nx_bits(va2))
-constraint13 = nx_bits(va2) == phy_nx(mmu1(va2))
-
-
-def is_writable(va):
-    s = Solver()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint_wx)
-    s.add(constraint3)
-    s.add(constraint4)
-
+# (z3py builds a != b as the two-argument Distinct(a, b); the != spelling
+# is only for readability and gives the solver the same term)
+constraint10 = ro_bits(va) != ro_bits(va1)
+constraint11 = ro_bits(va1) == phy_ro(pa) 
+constraint12 = nx_bits(va) != nx_bits(va2)
+constraint13 = nx_bits(va2) == phy_nx(pa)
+
+
+# W^X theory over the symbolic va, and the W^X theory with aliases
+_WX_THEORY = [constraint0, constraint_wx, constraint3, constraint4]
+_ALIAS_THEORY = _WX_THEORY + [constraint5, constraint10, constraint11, constraint12, constraint13]
+
+
+# Run the simplifier over a constraint set once, so the solvers get the
+# simplified assertions instead of re-simplifying the raw ones per query
+def _simplified(constraints):
+    goal = Goal()
+    goal.add(constraints)
+    return list(Then(Tactic('simplify'), Tactic('propagate-values'))(goal)[0])
+
+_WX = _simplified(_WX_THEORY)
+_SHARED_ASSERTIONS = _simplified(_ALIAS_THEORY)
+
+
+# Page number of the address va_val as a 20-bit constant. The constants are
+# cached so re-querying an address does not rebuild its AST node.
+@lru_cache(maxsize=4096)
+def page_number(va_val):
+    return BitVecVal(va_val >> PAGE_SHIFT, 20)
+
+
+# Only page-aligned addresses are mapped; an unaligned va_val makes the
+# query unsat, as the old (va & 0xFFF) == 0 constraint did
+@lru_cache(maxsize=4096)
+def page_aligned(va_val):
+    return BoolVal(va_val & PAGE_MASK == 0)
+
+
+# The queries are small and incremental: skip the per-check auto
+# configuration and turn relevancy propagation off
+_SMT_PARAMS = {'auto_config': False, 'relevancy': 0}
+
+
+# Shared solver: the W^X theory over the symbolic va is asserted once, and
+# each query only pushes its va binding and access flag on top of it.
+_S = SolverFor('QF_UFBV')
+_S.set(**_SMT_PARAMS)
+_S.add(_WX)
+
+
+# Alias template: the W^X theory plus the alias mapping, built once.
+# Each alias query works on a disposable translate() clone of it, so the
+# asserted formulas are copied over instead of being re-added per call.
+# It is a SimpleSolver, cheaper to clone than QF_UFBV.
+def _build_template():
+    s = SimpleSolver()
+    s.set(**_SMT_PARAMS)
+    s.add(_SHARED_ASSERTIONS)
+    return s
+
+_template = _build_template()
+
+
+# Cheap refutation of known-unsat query shapes before calling the solver.
+# It works on the raw theory, whose implications it can unfold.
+# Conjunctions and implications whose guard is asserted are unfolded, the
+# asserted equalities are merged into classes, and the assertions are unsat
+# if some disequality relates two terms of the same class (A == B, A != B).
+# False means "not refuted", not "sat".
+def _is_trivially_unsat(assertions):
+    true, false = BoolVal(True), BoolVal(False)
+    parent = {}
+
+    def find(t):
+        k = t.get_id()
+        while parent.get(k, k) != k:
+            k = parent[k]
+        return k
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    pending = list(assertions)
+    implications = []
+    distincts = []
+    while pending:
+        for f in pending:
+            if is_and(f):
+                implications.append((true, f.children()))
+            elif is_implies(f):
+                implications.append((f.arg(0), [f.arg(1)]))
+            elif is_eq(f):
+                union(f.arg(0), f.arg(1))
+            elif is_distinct(f) and f.num_args() == 2:
+                distincts.append((f.arg(0), f.arg(1)))
+            elif is_not(f) and is_eq(f.arg(0)):
+                distincts.append((f.arg(0).arg(0), f.arg(0).arg(1)))
+            elif is_not(f):
+                union(f.arg(0), false)
+            elif not is_true(f):
+                union(f, true)
+        # Fire the implications whose guard has become true
+        fired = [consequents for guard, consequents in implications if find(guard) == find(true)]
+        implications = [(guard, consequents) for guard, consequents in implications
+                        if find(guard) != find(true)]
+        pending = [f for consequents in fired for f in consequents]
+
+    if find(true) == find(false):
+        return True
+    return any(find(a) == find(b) for a, b in distincts)
+
+
+# Query-specific assertions of the alias checks: va, the access flag, and an
+# alias whose permission bit differs from va's
+def alias_write_query(va_val):
+    return [va == page_number(va_val), page_aligned(va_val), write,
+            ro_bits(va1) != ro_bits(va)]
+
+
+def alias_execute_query(va_val):
+    return [va == page_number(va_val), page_aligned(va_val), execute,
+            nx_bits(va1) != nx_bits(va)]
+
+
+def is_writable(va_val, with_model=False):
     # Check if the constraints are satisfiable for the given va and write access
-    s.push()
-    s.add(va == BitVecVal(va, 32))
-    s.add(write == True)
-    CheckSatResult = s.check()
+    _S.set('model', with_model)
+    _S.push()
+    _S.add(va == page_number(va_val), page_aligned(va_val), write)
+    CheckSatResult = _S.check()
         
-    if CheckSatResult == sat:
-        m = s.model()
+    if with_model and CheckSatResult == sat:
+        m = _S.model()
         print("=== write: ", m.evaluate(write), " ===")
         print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
+        print("phy_ro: ", m.evaluate(phy_ro(pa)))
         print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
+        print("phy_nx: ", m.evaluate(phy_nx(pa)))
 
-    s.pop()
+    _S.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult == sat
 
 
-def is_executable(va):
-    s = Solver()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint_wx)
-    s.add(constraint3)
-    s.add(constraint4)
-
+def is_executable(va_val, with_model=False):
     # Check if the constraints are satisfiable for the given va and execute access
-    s.push()
-    s.add(va == BitVecVal(va, 32))
-    s.add(execute == True)
-    CheckSatResult = s.check()
+    _S.set('model', with_model)
+    _S.push()
+    _S.add(va == page_number(va_val), page_aligned(va_val), execute)
+    CheckSatResult = _S.check()
         
-    if CheckSatResult == sat:
-        m = s.model()
+    if with_model and CheckSatResult == sat:
+        m = _S.model()
         print("=== execute: ", m.evaluate(execute), " ===")
         print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
+        print("phy_ro: ", m.evaluate(phy_ro(pa)))
         print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
+        print("phy_nx: ", m.evaluate(phy_nx(pa)))
 
-    s.pop()
+    _S.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult == sat
 
 
-def is_alias_writable(va):
-    s = Solver()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint_wx)
-    s.add(constraint3)
-    s.add(constraint4)
-
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint11)
-    s.add(constraint12)
-    s.add(constraint13)
-
+def is_alias_writable(va_val, with_model=False):
     # Check if the constraints are satisfiable for the given va and write access
-    s.push()
-    s.add(va == BitVecVal(va, 32))
-    s.add(write == True)
-    s.add(Distinct(ro_bits(va1), ro_bits(va)))
+    query = alias_write_query(va_val)
+    # Known-unsat shapes are refuted without a solver call
+    if _is_trivially_unsat(_ALIAS_THEORY + query):
+        return False
+
+    s = _template.translate(_template.ctx)
+    s.set('model', with_model, **_SMT_PARAMS)
+    s.add(query)
     CheckSatResult = s.check()
         
-    if CheckSatResult == sat:
+    if with_model and CheckSatResult == sat:
         m = s.model()
         print("=== write: ", m.evaluate(write), " ===")
         print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
+        print("phy_ro: ", m.evaluate(phy_ro(pa)))
         print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
+        print("phy_nx: ", m.evaluate(phy_nx(pa)))
 
-    s.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult == sat
 
 
-def is_alias_executable(va):
-    s = Solver()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint_wx)
-    s.add(constraint3)
-    s.add(constraint4)
-
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint11)
-    s.add(constraint12)
-    s.add(constraint13)
-
+def is_alias_executable(va_val, with_model=False):
     # Check if the constraints are satisfiable for the given va and execute access
-    s.push()
-    s.add(va == BitVecVal(va, 32))
-    s.add(execute == True)
-    s.add(Distinct(nx_bits(va1), nx_bits(va)))
+    query = alias_execute_query(va_val)
+    # Known-unsat shapes are refuted without a solver call
+    if _is_trivially_unsat(_ALIAS_THEORY + query):
+        return False
+
+    s = _template.translate(_template.ctx)
+    s.set('model', with_model, **_SMT_PARAMS)
+    s.add(query)
     CheckSatResult = s.check()
         
-    if CheckSatResult == sat:
+    if with_model and CheckSatResult == sat:
         m = s.model()
         print("=== execute: ", m.evaluate(execute), " ===")
         print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
+        print("phy_ro: ", m.evaluate(phy_ro(pa)))
         print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
+        print("phy_nx: ", m.evaluate(phy_nx(pa)))
 
-    s.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult == sat
 
-va_val = BitVecVal(0x12345000, 32).as_long()
-
-if is_alias_writable(va_val):
-    print("==== alias write({}) satisfied ====".format(hex(va_val)))
-else:
-    print("alias write({}) unsatisfied".format(hex(va_val)))
 
-if is_alias_executable(va_val):
-    print("==== alias execute({}) satisfied ====".format(hex(va_val)))
-else:
-    print("alias execute({}) unsatisfied".format(hex(va_val)))
-    
\ No newline at end of file
+# Run the alias write and execute checks concurrently and return their
+# (writable, executable) verdicts. z3 contexts are not thread safe, so each
+# check gets its own Context: the template and the query are translated
+# into it here, and only check() runs on the worker threads.
+def check_alias_permissions(va_val):
+    queries = (alias_write_query(va_val), alias_execute_query(va_val))
+    solvers = {}
+    for i, query in enumerate(queries):
+        # Known-unsat shapes are refuted without a solver call
+        if _is_trivially_unsat(_ALIAS_THEORY + query):
+            continue
+        ctx = Context()
+        s = _template.translate(ctx)
+        s.set('model', False, **_SMT_PARAMS)
+        s.add([q.translate(ctx) for q in query])
+        solvers[i] = s
+
+    futures = {}
+    # No threads are started when every query was refuted up front
+    if solvers:
+        with ThreadPoolExecutor(max_workers=len(solvers)) as executor:
+            futures = {i: executor.submit(s.check) for i, s in solvers.items()}
+
+    return tuple(i in futures and futures[i].result() == sat for i in range(len(queries)))
+
+
+if __name__ == "__main__":
+    va_val = 0x12345000
+
+    alias_writable, alias_executable = check_alias_permissions(va_val)
+
+    if alias_writable:
+        print("==== alias write({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("alias write({}) unsatisfied".format(hex(va_val)))
+
+    if alias_executable:
+        print("==== alias execute({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("alias execute({}) unsatisfied".format(hex(va_val)))
@@ -8,173 +8,345 @@
 # --> specifies access permission for va
 # is_writable, is_executable set/unset ro, nx bits exclusively.
 
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import product
+
 from z3 import *
 
+# Closed-form deciders generated from this theory by generate_decider.py
+try:
+    import wx_decider
+except ImportError:
+    wx_decider = None
+
+# Addresses are page aligned, so the low 12 bits (page offset) are always
+# zero. va, pa are encoded as 20-bit page numbers (address >> PAGE_SHIFT)
+# instead of 32-bit addresses with an alignment constraint.
+PAGE_SHIFT = 12
+PAGE_MASK = (1 << PAGE_SHIFT) - 1
+
 # Define symbolic variables
-mmu1 = Function('mmu1', BitVecSort(32), BitVecSort(32))
-va = BitVec('va', 32)
-va1 = BitVec('va1', 32)  # va1 is an alias of va
-va2 = BitVec('va2', 32)
-pa = BitVec('pa', 32)
+mmu1 = Function('mmu1', BitVecSort(20), BitVecSort(20))
+va = BitVec('va', 20)
+pa = BitVec('pa', 20)
 write = Bool('write')
 execute = Bool('execute')
 
 # Access permission on page table
-ro_bits = Function('ro_bits', BitVecSort(32), BoolSort())  # ro_bits(va) = 1 when set
-nx_bits = Function('nx_bits', BitVecSort(32), BoolSort())  # nx_bits(va) = 1 when set
+ro_bits = Function('ro_bits', BitVecSort(20), BoolSort())  # ro_bits(va) = 1 when set
+nx_bits = Function('nx_bits', BitVecSort(20), BoolSort())  # nx_bits(va) = 1 when set
 
 # Access permission on physical memory
-phy_ro = Function('phy_ro', BitVecSort(32), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
-phy_nx = Function('phy_nx', BitVecSort(32), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
+phy_ro = Function('phy_ro', BitVecSort(20), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
+phy_nx = Function('phy_nx', BitVecSort(20), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
 
 # Define constraints
-# Constraint 0,1,2: Virtual address maps to the same physical address in the page table
+# Constraint 0: Virtual address maps to the same physical address in the page table
 constraint0 = mmu1(va) == pa
-constraint1 = (va & 0xFFF) == 0
-constraint2 = (pa & 0xFFF) == 0
 
 # W^X property
-constraint_wx = Distinct(phy_ro(mmu1(va)), phy_nx(mmu1(va)))
+constraint_wx = phy_ro(pa) != phy_nx(pa)
 
 # Constraint 3: Virtual access permission (ro_bits) is set to physical access permission (phy_ro) when page is writable,
 # and unset when writing to virtual page
 #constraint3 = Implies(write, And (ro_bits(va) == phy_ro(mmu1(va))), (ro_bits(va) == False))
 constraint3 = Implies(write, ((ro_bits(va) == False)) )
-constraint4 = Implies(write, (phy_ro(mmu1(va)) == False) )
+constraint4 = Implies(write, (phy_ro(pa) == False) )
 
 # Constraint 4: Virtual access permission (nx_bits) is set to physical access permission (phy_nx) when executing from virtual page,
 # and unset when executing
 constraint5 = Implies(execute, (nx_bits(va) == False))
-constraint6 = Implies(execute, (phy_nx(mmu1(va)) == False) )
+constraint6 = Implies(execute, (phy_nx(pa) == False) )
 
-def is_writable(va):
-    s = Solver()
-    s.push()
-    
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint_wx)
-    s.add(constraint3)
-    s.add(constraint4)
+# Constraint groups: the mapping and W^X base every query shares, and the
+# write / execute specific tails
+_BASE = [constraint0, constraint_wx]
+_WRITE_TAIL = [constraint3, constraint4]
+_EXEC_TAIL = [constraint5, constraint6]
+
+# Once a query pins its access flag, the implication of the tail adds
+# nothing: the queries assert the consequents directly instead, so only the
+# base theory is shared
+_WRITE_RAW = [c.arg(1) for c in _WRITE_TAIL]
+_EXEC_RAW = [c.arg(1) for c in _EXEC_TAIL]
+
+# Run the simplifier over the theory once at import, so the solver gets the
+# simplified assertions instead of re-simplifying the raw ones per query
+def _simplified(constraints):
+    goal = Goal()
+    goal.add(constraints)
+    return list(Then(Tactic('simplify'), Tactic('propagate-values'),
+                     Tactic('ctx-solver-simplify'))(goal)[0])
+
+_THEORY = _simplified(_BASE)
+
+# Shared solver: the W^X theory is asserted once at import, and each query
+# only pushes its own va binding and access flag on top of it.
+_S = SolverFor('QF_UFBV')
+_S.add(_THEORY)
+
+
+# Terms printed from a satisfying model, built once here instead of on
+# every sat query
+_REPORT_TERMS = [("ro_bits: ", ro_bits(va)), ("phy_ro: ", phy_ro(pa)),
+                 ("nx_bits: ", nx_bits(va)), ("phy_nx: ", phy_nx(pa))]
+
+
+# Print the access flags and the report terms of a model; only called by
+# verbose queries, so the default path never evaluates the model
+def _dump(m, *flags):
+    for flag in flags:
+        print("=== {}: ".format(flag), m.evaluate(flag), " ===")
+    for name, term in _REPORT_TERMS:
+        print(name, m.evaluate(term))
+
+
+# Page number of the address va_val as a 20-bit constant. The constants are
+# cached so re-querying an address does not rebuild its AST node.
+@lru_cache(maxsize=4096)
+def page_number(va_val):
+    return BitVecVal(va_val >> PAGE_SHIFT, 20)
+
+
+# Only page-aligned addresses are mapped; an unaligned va_val makes the
+# query unsat, as the old (va & 0xFFF) == 0 constraint did
+@lru_cache(maxsize=4096)
+def page_aligned(va_val):
+    return BoolVal(va_val & PAGE_MASK == 0)
+
+
+# Query-specific facts can be passed to check() as assumptions instead of
+# being pushed and popped: p_write / p_execute guard the access flags, and
+# the va binding itself is passed as an assumption. Only the flag guards are
+# asserted, once, so the solver keeps its state between queries and does
+# not grow with the number of addresses queried (z3 takes the binding
+# equality as an assumption without asserting anything for it).
+# Set USE_ASSUMPTIONS to False to fall back to push/pop.
+USE_ASSUMPTIONS = True
+
+p_write = Bool('p_write')
+p_execute = Bool('p_execute')
+_S.add(Implies(p_write, And(write, *_WRITE_RAW)),
+       Implies(p_execute, And(execute, *_EXEC_RAW)))
+
+# Assumptions binding va to the page of va_val
+def va_binding(va_val):
+    return [va == page_number(va_val), page_aligned(va_val)]
+
+
+# Past the va binding, the theory only constrains six Booleans: the access
+# flags and ro_bits(va), phy_ro(pa), nx_bits(va), phy_nx(pa) (mmu1(va) == pa
+# holds for any va with a fresh pa). With the flags fixed by the query, the
+# 16 valuations of the permission bits are enumerated in Python instead of
+# calling z3. Queries without a model report use the closed-form
+# predicates of wx_decider.py instead, when it has been generated.
+# Run with --use-z3 (or set USE_Z3) to decide on the solver.
+USE_Z3 = False
+
+@lru_cache(maxsize=None)
+def _witness(write_val, execute_val):
+    for ro, p_ro, nx, p_nx in product([False, True], repeat=4):
+        if (p_ro != p_nx
+                and not (write_val and ro) and not (write_val and p_ro)
+                and not (execute_val and nx) and not (execute_val and p_nx)):
+            return ro, p_ro, nx, p_nx
+    return None
+
+def _decide(va_val, write_val, execute_val, verbose):
+    if va_val & PAGE_MASK != 0:
+        return unsat
+    witness = _witness(write_val, execute_val)
+    if witness is None:
+        return unsat
+    if not verbose:
+        return sat
+    if write_val:
+        print("=== write: ", write_val, " ===")
+    if execute_val:
+        print("=== execute: ", execute_val, " ===")
+    for (name, _), value in zip(_REPORT_TERMS, witness):
+        print(name, value)
+    return sat
+
+
+# Batch check over many addresses (e.g. a page range audit). The
+# permission part of the decision does not depend on va, so it is decided
+# once for the sweep and each address only checks its alignment.
+# Returns one bool per address, without the model report.
+def sweep(va_vals, write_val=True, execute_val=False):
+    if _witness(write_val, execute_val) is None:
+        return [False] * len(va_vals)
+    return [va_val & PAGE_MASK == 0 for va_val in va_vals]
+
+
+# The theory does not change within a process, so the verdicts are cached
+# per va_val; repeated queries for an address skip the solver. The model
+# report is only printed with verbose=True, by the first such call.
+@lru_cache(maxsize=4096)
+def is_writable(va_val, verbose=False):
+    if not USE_Z3:
+        if wx_decider is not None and not verbose:
+            return sat if wx_decider.is_writable(va_val) else unsat
+        return _decide(va_val, True, False, verbose)
 
     # Check if the constraints are satisfiable for the given va and write access
-    s.add(va == BitVecVal(va, 32))
-    s.add(write == True)
-    CheckSatResult = s.check()
+    if USE_ASSUMPTIONS:
+        CheckSatResult = _S.check(*va_binding(va_val), p_write)
+    else:
+        _S.push()
+        _S.add(va == page_number(va_val), page_aligned(va_val))
+        _S.add(write, *_WRITE_RAW)
+        CheckSatResult = _S.check()
         
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== write: ", m.evaluate(write), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
-
-    s.pop()
+    if verbose and CheckSatResult == sat:
+        _dump(_S.model(), write)
+
+    if not USE_ASSUMPTIONS:
+        _S.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult
 
 
-def is_executable(va):
-    s = Solver()
-    s.push()
-    
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint_wx)
-    s.add(constraint5)
-    s.add(constraint6)
+@lru_cache(maxsize=4096)
+def is_executable(va_val, verbose=False):
+    if not USE_Z3:
+        if wx_decider is not None and not verbose:
+            return sat if wx_decider.is_executable(va_val) else unsat
+        return _decide(va_val, False, True, verbose)
 
     # Check if the constraints are satisfiable for the given va and execute access
-    s.add(va == BitVecVal(va, 32))
-    s.add(execute == True)
-    CheckSatResult = s.check()
+    if USE_ASSUMPTIONS:
+        CheckSatResult = _S.check(*va_binding(va_val), p_execute)
+    else:
+        _S.push()
+        _S.add(va == page_number(va_val), page_aligned(va_val))
+        _S.add(execute, *_EXEC_RAW)
+        CheckSatResult = _S.check()
     
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
-
-    s.pop()
+    if verbose and CheckSatResult == sat:
+        _dump(_S.model(), execute)
+
+    if not USE_ASSUMPTIONS:
+        _S.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult
    
-def basic_mapping(va):
-    
-    s = Solver()
-    s.push()
+# Mapping-only template for basic_mapping, built once and cloned per query
+# with translate() instead of re-adding its constraints to a fresh solver.
+# The translated templates are SimpleSolvers, cheaper to clone than QF_UFBV.
+_MAPPING_TEMPLATE = SimpleSolver()
+_MAPPING_TEMPLATE.add(constraint0)
+
+def basic_mapping(va_val):
     
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
+    s = _MAPPING_TEMPLATE.translate(main_ctx())
+    # Only the verdict is used, so skip model construction
+    s.set('model', False)
     
     # Check if the constraints are satisfiable for the given va and execute access
-    s.add(va == BitVecVal(va, 32))
-    s.add(execute == True)
+    s.add(va == page_number(va_val), page_aligned(va_val))
+    s.add(execute)
     CheckSatResult = s.check()
     
-    s.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult
 
     
-def is_writable_and_executable(va):
-    s = Solver()
-    s.push()
-    
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    
-    s.add(constraint_wx)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    
+@lru_cache(maxsize=4096)
+def is_writable_and_executable(va_val, verbose=False):
+    if not USE_Z3:
+        if wx_decider is not None and not verbose:
+            return sat if wx_decider.is_writable_and_executable(va_val) else unsat
+        return _decide(va_val, True, True, verbose)
+
     # Check if the constraints are satisfiable for the given va and execute access
-    s.add(va == BitVecVal(va, 32))
-    s.add(And (execute == True), (write == True))
-    CheckSatResult = s.check()
+    if USE_ASSUMPTIONS:
+        CheckSatResult = _S.check(*va_binding(va_val), p_write, p_execute)
+    else:
+        _S.push()
+        _S.add(va == page_number(va_val), page_aligned(va_val))
+        _S.add(write, *_WRITE_RAW, execute, *_EXEC_RAW)
+        CheckSatResult = _S.check()
     
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== write: ", m.evaluate(write), " ===")
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu1(va))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu1(va))))
-
-    s.pop()
+    if verbose and CheckSatResult == sat:
+        _dump(_S.model(), write, execute)
+
+    if not USE_ASSUMPTIONS:
+        _S.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult
 
 
-va_val = BitVecVal(0x12345000, 32).as_long()
-
-if is_writable(va_val) == sat:
-    print("==== write({}) satisfied ====".format(hex(va_val)))
-else:
-    print("write({}) unsatisfied".format(hex(va_val)))
-
-if is_executable(va_val) == sat:
-    print("==== execute({}) satisfied ====".format(hex(va_val)))
-else:
-    print("execute({}) unsatisfied".format(hex(va_val)))
- 
- 
-if is_writable_and_executable(va_val) == sat:
-    print("==== write & execute({}) satisfied ====".format(hex(va_val)))
-else:
-    print("write & execute({}) unsatisfied".format(hex(va_val)))
- 
\ No newline at end of file
+# W^X template for check_all, built once and translated per query
+_WX_TEMPLATE = SimpleSolver()
+_WX_TEMPLATE.add(_THEORY)
+
+# Run the write, execute and write & execute checks on z3 concurrently and
+# return their (writable, executable, writable_and_executable) verdicts.
+# z3 contexts are not thread safe, so each check gets its own Context: the
+# template and the query are translated into it here, and only check()
+# runs on the worker threads.
+def check_all(va_val):
+    binding = [va == page_number(va_val), page_aligned(va_val)]
+    queries = (binding + [write] + _WRITE_RAW,
+               binding + [execute] + _EXEC_RAW,
+               binding + [write, execute] + _WRITE_RAW + _EXEC_RAW)
+    solvers = []
+    for query in queries:
+        ctx = Context()
+        s = _WX_TEMPLATE.translate(ctx)
+        s.set('model', False)
+        s.add([q.translate(ctx) for q in query])
+        solvers.append(s)
+
+    with ThreadPoolExecutor(max_workers=len(solvers)) as executor:
+        futures = [executor.submit(s.check) for s in solvers]
+
+    return tuple(f.result() for f in futures)
+
+
+# Run the write, execute and write & execute checks in sequence on the
+# shared solver and return their verdicts. The queries share the theory,
+# so the solver keeps what it learned from one query for the next. For
+# three queries this is much cheaper than check_all, whose per-query
+# Context and translate() cost more than the checks themselves.
+def run_queries(va_val):
+    binding = [va == page_number(va_val), page_aligned(va_val)]
+    queries = ([write] + _WRITE_RAW, [execute] + _EXEC_RAW,
+               [write, execute] + _WRITE_RAW + _EXEC_RAW)
+    results = []
+    for query in queries:
+        _S.push()
+        _S.add(*binding, *query)
+        results.append(_S.check())
+        _S.pop()
+    return tuple(results)
+
+
+if __name__ == "__main__":
+    USE_Z3 = '--use-z3' in sys.argv
+    va_val = 0x12345000
+
+    if USE_Z3:
+        writable, executable, writable_and_executable = run_queries(va_val)
+    else:
+        writable = is_writable(va_val, verbose=True)
+        executable = is_executable(va_val, verbose=True)
+        writable_and_executable = is_writable_and_executable(va_val, verbose=True)
+
+    if writable == sat:
+        print("==== write({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("write({}) unsatisfied".format(hex(va_val)))
+
+    if executable == sat:
+        print("==== execute({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("execute({}) unsatisfied".format(hex(va_val)))
+
+    if writable_and_executable == sat:
+        print("==== write & execute({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("write & execute({}) unsatisfied".format(hex(va_val)))
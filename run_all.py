@@ -0,0 +1,87 @@
+
+# All paging theorems in one process
+#
+# Runs the checks of paging.py, paging_alias.py, paging_wx_memory.py and
+# paging_alias_wx_unsatisfiable.py against one resident solver.
+# The declarations and the va-to-pa mapping are shared by every scenario;
+# each scenario pushes its own constraints, checks, and pops them again.
+
+from z3 import *
+
+# Addresses are encoded as 20-bit page numbers (address >> PAGE_SHIFT),
+# as in the individual scripts
+PAGE_SHIFT = 12
+
+# Define symbolic variables
+mmu1 = Function('mmu1', BitVecSort(20), BitVecSort(20))
+va = BitVec('va', 20)
+va1 = BitVec('va1', 20)  # va1 is an alias of va
+va2 = BitVec('va2', 20)
+pa = BitVec('pa', 20)
+write = Bool('write')
+execute = Bool('execute')
+
+# Access permission on page table
+ro_bits = Function('ro_bits', BitVecSort(20), BoolSort())  # ro_bits(va) = 1 when set
+nx_bits = Function('nx_bits', BitVecSort(20), BoolSort())  # nx_bits(va) = 1 when set
+
+# Access permission on physical memory
+phy_ro = Function('phy_ro', BitVecSort(20), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
+phy_nx = Function('phy_nx', BitVecSort(20), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
+
+# Virtual address maps to the physical address in the page table (shared)
+mapping = mmu1(va) == pa
+
+# paging.py: page table permission matches the physical permission
+permission = [ro_bits(va) == phy_ro(pa), nx_bits(va) == phy_nx(pa)]
+
+# paging_alias.py: aliases va1, va2 of pa with a different ro / nx bit
+alias = [Distinct(va, va1, va2),
+         ro_bits(va) != ro_bits(va1), ro_bits(va1) == phy_ro(pa),
+         nx_bits(va) != nx_bits(va2), nx_bits(va2) == phy_nx(pa)]
+
+# paging_wx_memory.py: physical W^X, ro / nx unset on write / execute
+wx_memory = [phy_ro(pa) != phy_nx(pa),
+             Implies(write, ro_bits(va) == False), Implies(write, phy_ro(pa) == False),
+             Implies(execute, nx_bits(va) == False), Implies(execute, phy_nx(pa) == False)]
+
+# paging_alias_wx_unsatisfiable.py: page table W^X following the physical permission
+wx_page_table = [ro_bits(va) != nx_bits(va),
+                 Implies(write, And(ro_bits(va) == phy_ro(pa), ro_bits(va) == False)),
+                 Implies(execute, And(nx_bits(va) == phy_nx(pa), nx_bits(va) == False))]
+
+va_val = 0x12345000
+va_is = va == BitVecVal(va_val >> PAGE_SHIFT, 20)
+
+# (name, scenario constraints, expected verdict)
+SCENARIOS = [
+    ("basic mapping", permission, sat),
+    ("alias mapping with different permission", permission + alias, unsat),
+    ("wx memory write({})".format(hex(va_val)), wx_memory + [va_is, write], sat),
+    ("wx memory execute({})".format(hex(va_val)), wx_memory + [va_is, execute], sat),
+    ("wx memory write & execute({})".format(hex(va_val)), wx_memory + [va_is, write, execute], unsat),
+    ("alias write({})".format(hex(va_val)),
+     wx_page_table + alias + [va_is, write, ro_bits(va1) != ro_bits(va)], unsat),
+    ("alias execute({})".format(hex(va_val)),
+     wx_page_table + alias + [va_is, execute, nx_bits(va1) != nx_bits(va)], unsat),
+]
+
+
+# Check every scenario on one solver and return (name, result, expected)
+def run_all():
+    s = SolverFor('QF_UFBV')
+    s.set(auto_config=False, relevancy=0, model=False)
+    s.add(mapping)
+
+    results = []
+    for name, constraints, expected in SCENARIOS:
+        s.push()
+        s.add(constraints)
+        results.append((name, s.check(), expected))
+        s.pop()
+    return results
+
+
+if __name__ == "__main__":
+    for name, result, expected in run_all():
+        print("{}: {}{}".format(name, result, "" if result == expected else " (expected {})".format(expected)))
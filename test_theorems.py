@@ -18,24 +18,104 @@ def test_alias_mapping():
 def test_paging_wx_memory():
     import paging_wx_memory
     
-    va_val = BitVecVal(0x12345000, 32).as_long()
+    va_val = 0x12345000
     assert paging_wx_memory.basic_mapping(va_val) == z3.sat , "basic mapping unsatisfiable"
     assert paging_wx_memory.is_writable(va_val) == z3.sat , "is_writable unsatisfiable"
     assert paging_wx_memory.is_executable(va_val) == z3.sat , "is_executable unsatisfiable"
     assert paging_wx_memory.is_writable_and_executable(va_val) == z3.unsat , "w+x at the same time unsatisfiable"
+    assert paging_wx_memory.is_writable(va_val + 0x800) == z3.unsat , "unaligned va is not mapped"
     
+    # The Python truth-table decider agrees with z3 (wx_decider is set aside
+    # so the queries reach _decide)
+    use_z3 = paging_wx_memory.USE_Z3
+    wx_decider = paging_wx_memory.wx_decider
+    try:
+        paging_wx_memory.wx_decider = None
+        for va in (va_val, va_val + 0x800):
+            for check in (paging_wx_memory.is_writable, paging_wx_memory.is_executable,
+                          paging_wx_memory.is_writable_and_executable):
+                paging_wx_memory.USE_Z3 = True
+                expected = check.__wrapped__(va)
+                paging_wx_memory.USE_Z3 = False
+                assert check.__wrapped__(va) == expected , "{}({}) disagrees with z3".format(check.__name__, hex(va))
+        
+        # z3 queries over new addresses do not add assertions to the shared solver
+        paging_wx_memory.USE_Z3 = True
+        paging_wx_memory.is_writable.__wrapped__(va_val)
+        assertions = len(paging_wx_memory._S.assertions())
+        for page in range(1, 5):
+            paging_wx_memory.is_writable.__wrapped__(va_val + page * 0x1000)
+        assert len(paging_wx_memory._S.assertions()) == assertions , "queries left assertions on the shared solver"
+    finally:
+        paging_wx_memory.USE_Z3 = use_z3
+        paging_wx_memory.wx_decider = wx_decider
+    
+    assert paging_wx_memory.sweep([va_val, va_val + 0x1000, va_val + 0x800]) == [True, True, False] , "write sweep"
+    assert paging_wx_memory.sweep([va_val, va_val + 0x1000], True, True) == [False, False] , "w+x sweep"
+    assert paging_wx_memory.check_all(va_val) == (z3.sat, z3.sat, z3.unsat) , "concurrent checks disagree"
+    assert paging_wx_memory.run_queries(va_val) == (z3.sat, z3.sat, z3.unsat) , "sequential checks disagree"
+    
+def test_paging_alias_wx_unsatisfiable():
+    import paging_alias_wx_unsatisfiable
+    
+    va_val = 0x12345000
+    assert paging_alias_wx_unsatisfiable.is_writable(va_val) , "is_writable unsatisfiable"
+    assert paging_alias_wx_unsatisfiable.is_executable(va_val) , "is_executable unsatisfiable"
+    assert not paging_alias_wx_unsatisfiable.is_alias_writable(va_val) , "alias with different ro bit satisfiable"
+    assert not paging_alias_wx_unsatisfiable.is_alias_executable(va_val) , "alias with different nx bit satisfiable"
+    assert paging_alias_wx_unsatisfiable.check_alias_permissions(va_val) == (False, False) , "concurrent alias checks disagree"
+    
+    # Without the up-front refutation the queries reach the threaded check()
+    is_trivially_unsat = paging_alias_wx_unsatisfiable._is_trivially_unsat
+    try:
+        paging_alias_wx_unsatisfiable._is_trivially_unsat = lambda assertions: False
+        assert not paging_alias_wx_unsatisfiable.is_alias_writable(va_val) , "alias with different ro bit satisfiable"
+        assert paging_alias_wx_unsatisfiable.check_alias_permissions(va_val) == (False, False) , "concurrent alias checks disagree"
+    finally:
+        paging_alias_wx_unsatisfiable._is_trivially_unsat = is_trivially_unsat
+    
+def test_generate_decider():
+    import generate_decider
+    import wx_decider
+    
+    assert generate_decider.verify() , "wx_decider.py disagrees with z3"
+    with open(wx_decider.__file__) as f:
+        assert f.read() == generate_decider.generate() , "wx_decider.py is out of date"
+    assert not generate_decider.page_independent([generate_decider.wx.va == 5]) , "a page constant is not opaque"
+
 def test_wxvisor():
     import wxvisor
     
-    va_val = BitVecVal(0x12345000, 32).as_long()
-    va1_val = BitVecVal(0x23456000, 32).as_long()
+    va_val = 0x12345000
+    va1_val = 0x23456000
     assert wxvisor.basic_mapping(va_val) == z3.sat , "basic mapping unsatisfiable"
     assert wxvisor.alias_mapping(va_val, va1_val) == z3.sat , "aliases can have physically different access permission; thus unsatisfiable"
+    assert wxvisor.alias_mapping(va_val, va1_val + 0x800) == z3.sat , "the alias does not have to be page aligned"
+    assert wxvisor.alias_mapping(va_val, va_val + 0x800) == z3.unsat , "an alias in va's page is the same page as va"
     
     assert wxvisor.is_writable(va_val) == z3.sat , "is_writable unsatisfiable"
     assert wxvisor.is_executable(va_val) == z3.sat , "is_executable unsatisfiable"
     assert wxvisor.is_writable_and_executable(va_val) == z3.unsat , "w^x failure"
+    assert wxvisor.is_writable(va_val + 0x800) == z3.unsat , "unaligned va is not mapped"
+    
+    # The query binds the symbolic va to the page of va_val
+    assert wxvisor.is_writable.__wrapped__(va_val) == z3.sat , "is_writable unsatisfiable"
+    assert wxvisor._SOLVER.model().evaluate(wxvisor.va).as_long() == va_val >> wxvisor.PAGE_SHIFT , "va is not bound to va_val"
+    
+    # Queries over new addresses do not add assertions to the shared solver
+    assertions = len(wxvisor._SOLVER.assertions())
+    for page in range(1, 5):
+        wxvisor.is_writable.__wrapped__(va_val + page * 0x1000)
+    assert len(wxvisor._SOLVER.assertions()) == assertions , "queries left assertions on the shared solver"
     
     assert wxvisor.is_va_writable_but_alias_read_only(va_val, va1_val) == z3.unsat , "w+x at the same time unsatisfiable"
     assert wxvisor.is_va_executable_but_alias_nx(va_val, va1_val) == z3.unsat , "w+x at the same time unsatisfiable"
-    
\ No newline at end of file
+    assert wxvisor.run_queries(va_val, va1_val) == (z3.sat, z3.sat, z3.unsat, z3.unsat) , "batched driver queries disagree"
+    assert wxvisor.run_queries_cli(va_val, va1_val) == (z3.sat, z3.sat, z3.unsat, z3.unsat) , "z3 command line queries disagree"
+    assert wxvisor.run_queries_parallel(va_val, va1_val) == (z3.sat, z3.sat, z3.unsat, z3.unsat) , "parallel driver queries disagree"
+
+def test_run_all():
+    import run_all
+    
+    for name, result, expected in run_all.run_all():
+        assert result == expected , "{}: {}".format(name, result)
@@ -0,0 +1,17 @@
+
+# Generated by generate_decider.py from the paging_wx_memory.py theory.
+# Do not edit; rerun python generate_decider.py after changing the theory.
+
+PAGE_MASK = 0xfff
+
+
+def is_writable(va_val):
+    return va_val & PAGE_MASK == 0
+
+
+def is_executable(va_val):
+    return va_val & PAGE_MASK == 0
+
+
+def is_writable_and_executable(va_val):
+    return False
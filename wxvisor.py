@@ -10,346 +10,474 @@
 # mmu2 disallow alias mapping
 # mmu2 mandates W^X memory according to WXvisor's state transition model
 
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 from z3 import *
 
+# Addresses are page aligned, so the low 12 bits (page offset) are always
+# zero. va, ipa, pa are encoded as 20-bit page numbers (address >> PAGE_SHIFT)
+# instead of 32-bit addresses with alignment constraints.
+PAGE_SHIFT = 12
+PAGE_MASK = (1 << PAGE_SHIFT) - 1
+
 # Define symbolic variables
-mmu1 = Function('mmu1', BitVecSort(32), BitVecSort(32))
-va = BitVec('va', 32)
-va1 = BitVec('va1', 32)  # va1 is an alias of va
-va2 = BitVec('va2', 32)
-pa = BitVec('pa', 32)
+mmu1 = Function('mmu1', BitVecSort(20), BitVecSort(20))
+va = BitVec('va', 20)
+va1 = BitVec('va1', 20)  # va1 is an alias of va
+va2 = BitVec('va2', 20)
+pa = BitVec('pa', 20)
 write = Bool('write')
 execute = Bool('execute')
 
 # Wxvisor introduces ipa-to-pa mapping
-ipa = BitVec('ipa', 32) # va ----> ipa ----> pa
+ipa = BitVec('ipa', 20) # va ----> ipa ----> pa
 #                           mmu1      mmu2
-mmu2 = Function('mmu2', BitVecSort(32), BitVecSort(32))
-ipa1 = BitVec('ipa1', 32)
-ipa2 = BitVec('ipa2', 32)
+mmu2 = Function('mmu2', BitVecSort(20), BitVecSort(20))
+ipa1 = BitVec('ipa1', 20)
+ipa2 = BitVec('ipa2', 20)
 # ipa1,2 are alias to ipa (not allowed)
+mmu2_inv = Function('mmu2_inv', BitVecSort(20), BitVecSort(20))  # left inverse of mmu2
 
 # Access permission on mmu1 page table
-ro_bits = Function('ro_bits', BitVecSort(32), BoolSort())  # ro_bits(va) = 1 when set
-nx_bits = Function('nx_bits', BitVecSort(32), BoolSort())  # nx_bits(va) = 1 when set
+ro_bits = Function('ro_bits', BitVecSort(20), BoolSort())  # ro_bits(va) = 1 when set
+nx_bits = Function('nx_bits', BitVecSort(20), BoolSort())  # nx_bits(va) = 1 when set
 
 # Access permission by WXvisor
-ro_bits2 = Function('ro_bits2', BitVecSort(32), BoolSort())  # ro_bits(va) = 1 when set
-nx_bits2 = Function('nx_bits2', BitVecSort(32), BoolSort())  # nx_bits(va) = 1 when set
+ro_bits2 = Function('ro_bits2', BitVecSort(20), BoolSort())  # ro_bits(va) = 1 when set
+nx_bits2 = Function('nx_bits2', BitVecSort(20), BoolSort())  # nx_bits(va) = 1 when set
 
 # Access permission on physical memory
-phy_ro = Function('phy_ro', BitVecSort(32), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
-phy_nx = Function('phy_nx', BitVecSort(32), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
+phy_ro = Function('phy_ro', BitVecSort(20), BoolSort())  # phy_ro(pa) = 1 when pa is read-only
+phy_nx = Function('phy_nx', BitVecSort(20), BoolSort())  # phy_nx(pa) = 1 when pa is non-executable
 
 # Define constraints
-# Constraint 0,1,2: Virtual address maps to the same physical address in the page table
+# Constraint 0,3: Virtual address maps to the same physical address in the page table
+# ipa and pa name mmu1(va) and mmu2(mmu1(va)); the constraints below use the
+# constants instead of repeating the nested applications
 constraint0 = mmu1(va) == ipa
-constraint1 = (va & 0xFFF) == 0
-constraint2 = (ipa & 0xFFF) == 0
 constraint3 = mmu2(ipa) == pa
-constraint4 = (pa & 0xFFF) == 0
 
 # Constraint 3: mmu1 allows alias mapping, but mmu2 does not allow aliases
 constraint5 = Distinct(va, va1, va2)
 constraint6 = mmu1(va1) == ipa1
 constraint7 = mmu1(va2) == ipa2
-constraint8 = Implies( Distinct(ipa, ipa1), Distinct(mmu2(ipa), mmu2(ipa1)) )
+# mmu2 is injective on ipa and ipa1: rather than the implication
+# ipa != ipa1 -> mmu2(ipa) != mmu2(ipa1), mmu2 has a left inverse there,
+# which congruence closure handles directly (mmu2(ipa) is pa)
+constraint8 = And(mmu2_inv(pa) == ipa, mmu2_inv(mmu2(ipa1)) == ipa1)
 
 # Constant 9: least privilege principle
 # either va has RO bit in the mmu1 page table or RO bit in the mmu2 page table
-constraint9  = phy_ro(mmu2((mmu1(va)))) == Or (ro_bits(va), ro_bits2(mmu1(va)), ro_bits(va1), ro_bits2(mmu1(va)) )
-constraint10 = phy_nx(mmu2((mmu1(va)))) == Or (nx_bits(va), nx_bits2(mmu1(va)), nx_bits(va1), nx_bits2(mmu1(va1)) )
+constraint9  = phy_ro(pa) == Or (ro_bits(va), ro_bits2(ipa), ro_bits(va1) )
+constraint10 = phy_nx(pa) == Or (nx_bits(va), nx_bits2(ipa), nx_bits(va1), nx_bits2(ipa1) )
 
 # physical W^X property
-constraint_wx = Distinct(phy_ro(mmu2(mmu1(va))), phy_nx(mmu2(mmu1(va))))
+constraint_wx = phy_ro(pa) != phy_nx(pa)
 
 # Constraint 3: Virtual access permission (ro_bits) is set to physical access permission (phy_ro) when page is writable,
 # and unset when writing to virtual page
-constraint11 = Implies(write, (ro_bits2(mmu1(va)) == False))
-constraint12 = Implies(write, (phy_ro(mmu2(mmu1((va)))) == False))
+constraint11 = Implies(write, (ro_bits2(ipa) == False))
+constraint12 = Implies(write, (phy_ro(pa) == False))
 
 # Constraint 4: Virtual access permission (nx_bits) is set to physical access permission (phy_nx) when executing from virtual page,
 # and unset when executing
-constraint13 = Implies(execute, (nx_bits2(mmu1(va)) == False))
-constraint14 = Implies(execute, (phy_nx((mmu2(mmu1(va)))) == False) )
-
-def basic_mapping(va_val):
-    s = Solver()
-    s.push()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    
-    s.add(va == BitVecVal(va_val, 32))
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+constraint13 = Implies(execute, (nx_bits2(ipa) == False))
+constraint14 = Implies(execute, (phy_nx(pa) == False) )
+
+# Constraint groups: the nested mapping, the alias and least privilege
+# constraints, the W^X base every access query shares, and the write /
+# execute specific tails
+_MAPPING = [constraint0, constraint3]
+_ALIAS = [constraint5, constraint6, constraint7, constraint8, constraint9, constraint10]
+# The access queries never look at va2 (or ipa2): they only need va and va1
+# apart, so their base drops constraint7 and the va2 part of constraint5
+_ALIAS_PAIR = [va != va1, constraint6, constraint8, constraint9, constraint10]
+_BASE = _MAPPING + _ALIAS_PAIR + [constraint_wx]
+_WRITE_TAIL = [constraint11, constraint12]
+_EXEC_TAIL = [constraint13, constraint14]
+
+# Once a query pins its access flag, the implication of the tail adds
+# nothing: the queries assert the consequents directly instead, so only the
+# base theory is shared
+_WRITE_RAW = [c.arg(1) for c in _WRITE_TAIL]
+_EXEC_RAW = [c.arg(1) for c in _EXEC_TAIL]
+
+# The queries are small and incremental: skip the per-check auto
+# configuration and turn relevancy propagation off
+_SMT_PARAMS = {'auto_config': False, 'relevancy': 0}
+
+# Page number of the address va_val as a 20-bit constant. The constants are
+# cached so re-querying an address does not rebuild its AST node.
+@lru_cache(maxsize=4096)
+def page_number(va_val):
+    return BitVecVal(va_val >> PAGE_SHIFT, 20)
+
+
+# Only page-aligned addresses are mapped; an unaligned address makes the
+# query unsat, as the old (va & 0xFFF) == 0 constraint did
+@lru_cache(maxsize=4096)
+def page_aligned(va_val):
+    return BoolVal(va_val & PAGE_MASK == 0)
+
+
+# Run the simplifier over each theory once at import, so the solvers get the
+# simplified assertions instead of re-simplifying the raw ones per query
+def _simplified(constraints):
+    goal = Goal()
+    goal.add(constraints)
+    return list(Then(Tactic('simplify'), Tactic('propagate-values'),
+                     Tactic('ctx-solver-simplify'))(goal)[0])
+
+
+# Model terms printed by the verbose queries
+_REPORT_TERMS = [("ro_bits: ", ro_bits(va)), ("phy_ro: ", phy_ro(pa)),
+                 ("nx_bits: ", nx_bits(va)), ("phy_nx: ", phy_nx(pa))]
+_ALIAS_REPORT_TERMS = _REPORT_TERMS[:1] + [("ro_bits2: ", ro_bits2(ipa))] + _REPORT_TERMS[1:]
+
+# Print the access flags and the report terms of a model; only called by
+# verbose queries, so the default path never evaluates the model
+def _dump(m, *flags, terms=_REPORT_TERMS):
+    for flag in flags:
+        print("=== {}: ".format(flag), m.evaluate(flag), " ===")
+    for name, term in terms:
+        print(name, m.evaluate(term))
+
+
+# Shared solvers: each theory is asserted once at import on its own solver,
+# and each query only pushes its own va binding and access flag on top of
+# it. _BASIC_SOLVER holds the nested mapping (basic_mapping), _ALIAS_SOLVER
+# adds the alias and least privilege constraints (alias_mapping), and
+# _SOLVER holds the full W^X theory for the access queries.
+# All solvers here are SimpleSolvers; SolverFor('QF_UFBV') was no faster.
+# The theory stays asserted rather than re-parsed from SMT-LIB2 per query.
+# No bit-blasting tactic solver: it re-runs its tactic on every check.
+_BASIC_SOLVER = SimpleSolver()
+_BASIC_SOLVER.set(**_SMT_PARAMS)
+_BASIC_SOLVER.add(_simplified(_MAPPING))
+
+_ALIAS_SOLVER = SimpleSolver()
+_ALIAS_SOLVER.set(**_SMT_PARAMS)
+_ALIAS_SOLVER.add(_simplified(_MAPPING + _ALIAS))
+
+_SOLVER = SimpleSolver()
+_SOLVER.set(**_SMT_PARAMS)
+_THEORY = _simplified(_BASE)
+_SOLVER.add(_THEORY)
+
+# Query-specific facts are passed to check() as assumptions instead of
+# being pushed and popped, as in paging_wx_memory.py: the flag literals
+# guard the access flags (with their tails) and the alias disequalities,
+# and the address bindings themselves are passed as assumptions. Only the
+# flag guards are asserted, once, so the solvers keep their state between
+# queries and do not grow with the number of addresses queried. Set
+# USE_ASSUMPTIONS to False to fall back to push/pop.
+USE_ASSUMPTIONS = True
+
+p_write = Bool('p_write')
+p_execute = Bool('p_execute')
+p_ro_alias = Bool('p_ro_alias')
+p_nx_alias = Bool('p_nx_alias')
+_SOLVER.add(Implies(p_write, And(write, *_WRITE_RAW)),
+            Implies(p_execute, And(execute, *_EXEC_RAW)),
+            Implies(p_ro_alias, ro_bits(va1) != ro_bits(va)),
+            Implies(p_nx_alias, nx_bits(va1) != nx_bits(va)))
+
+# Assumptions binding the address symbol x to the page of x_val. Only va
+# has to be page aligned; the alias va1 never was, so only its page number
+# is bound and its page offset is dropped. An alias inside va's own page
+# is therefore the same page as va, and Distinct(va, va1, ...) makes such
+# queries unsat (with 32-bit addresses the offset alone kept them apart).
+def binding(x, x_val):
+    if x.eq(va):
+        return [va == page_number(x_val), page_aligned(x_val)]
+    return [x == page_number(x_val)]
+
+# A query on a shared solver (push/add/check/pop, or adding its literals
+# and checking) is not atomic, so concurrent callers take this lock around
+# the whole query
+_LOCK = threading.Lock()
+
+# The theories do not change within a process, so the verdicts are cached
+# per argument tuple; repeated queries skip the solver. The model report is
+# only printed with verbose=True, by the first such call.
+@lru_cache(maxsize=4096)
+def basic_mapping(va_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _BASIC_SOLVER.check(*binding(va, va_val))
+        else:
+            _BASIC_SOLVER.push()
+            _BASIC_SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+            CheckSatResult = _BASIC_SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_BASIC_SOLVER.model(), execute)
+
+        if not USE_ASSUMPTIONS:
+            _BASIC_SOLVER.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult
 
-def alias_mapping(va1_val, va2_val):
-    s = Solver()
-    s.push()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    
-    s.add(va == BitVecVal(va1_val, 32))
-    s.add(va1 == BitVecVal(va2_val, 32))
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+
+@lru_cache(maxsize=4096)
+def alias_mapping(va1_val, va2_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _ALIAS_SOLVER.check(*binding(va, va1_val),
+                                                 *binding(va1, va2_val))
+        else:
+            _ALIAS_SOLVER.push()
+            _ALIAS_SOLVER.add(va == page_number(va1_val), page_aligned(va1_val))
+            _ALIAS_SOLVER.add(*binding(va1, va2_val))
+            CheckSatResult = _ALIAS_SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_ALIAS_SOLVER.model(), execute)
+
+        if not USE_ASSUMPTIONS:
+            _ALIAS_SOLVER.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult
-    
-    
-
-def is_writable(va):
-    s = Solver()
-    s.push()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint11)
-    s.add(constraint12)
-    s.add(constraint_wx)
-
-    # Check if the constraints are satisfiable for the given va and write access
-    s.add(va == BitVecVal(va, 32))
-    s.add(write == True)
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+
+
+@lru_cache(maxsize=4096)
+def is_writable(va_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _SOLVER.check(*binding(va, va_val), p_write)
+        else:
+            _SOLVER.push()
+            # Check if the constraints are satisfiable for the given va and write access
+            _SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+            _SOLVER.add(write, *_WRITE_RAW)
+            CheckSatResult = _SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_SOLVER.model(), write)
+
+        if not USE_ASSUMPTIONS:
+            _SOLVER.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult
 
 
-def is_executable(va_val):
-    s = Solver()
-    s.push()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint13)
-    s.add(constraint14)
-    s.add(constraint_wx)
-
-    # Check if the constraints are satisfiable for the given va and execute access
-    s.add(va == BitVecVal(va_val, 32))
-    s.add(execute == True)
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+@lru_cache(maxsize=4096)
+def is_executable(va_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _SOLVER.check(*binding(va, va_val), p_execute)
+        else:
+            _SOLVER.push()
+            # Check if the constraints are satisfiable for the given va and execute access
+            _SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+            _SOLVER.add(execute, *_EXEC_RAW)
+            CheckSatResult = _SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_SOLVER.model(), execute)
+
+        if not USE_ASSUMPTIONS:
+            _SOLVER.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult
 
 
-def is_writable_and_executable(va_val):
-    s = Solver()
-    s.push()
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint11)
-    s.add(constraint12)
-    s.add(constraint13)
-    s.add(constraint14)
-    s.add(constraint_wx)
-
-    # Check if the constraints are satisfiable for the given va and write access
-    s.add(va == BitVecVal(va_val, 32))
-    s.add(And (write == True), (execute == True))
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+@lru_cache(maxsize=4096)
+def is_writable_and_executable(va_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _SOLVER.check(*binding(va, va_val), p_write, p_execute)
+        else:
+            _SOLVER.push()
+            # Check if the constraints are satisfiable for the given va and write access
+            _SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+            _SOLVER.add(write, *_WRITE_RAW, execute, *_EXEC_RAW)
+            CheckSatResult = _SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_SOLVER.model(), write, execute)
+
+        if not USE_ASSUMPTIONS:
+            _SOLVER.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult
 
-def is_va_writable_but_alias_read_only(va_val, va1_val):
-    s = Solver()
-    s.push()
-    s.add(va == BitVecVal(va_val, 32))
-    s.add(va1 == BitVecVal(va1_val, 32))
-    s.add(Distinct(ro_bits(va1), ro_bits(va)))
-    
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint11)
-    s.add(constraint12)
-    s.add(constraint13)
-    s.add(constraint14)
-    s.add(constraint_wx)
-
-    # Check if the constraints are satisfiable for the given va and write access
-    s.add(write == True)
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("ro_bits2: ", m.evaluate(ro_bits2(mmu1(va))))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+
+@lru_cache(maxsize=4096)
+def is_va_writable_but_alias_read_only(va_val, va1_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _SOLVER.check(*binding(va, va_val),
+                                           *binding(va1, va1_val), p_ro_alias, p_write)
+        else:
+            _SOLVER.push()
+            _SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+            _SOLVER.add(*binding(va1, va1_val))
+            _SOLVER.add(ro_bits(va1) != ro_bits(va))
+
+            # Check if the constraints are satisfiable for the given va and write access
+            _SOLVER.add(write, *_WRITE_RAW)
+            CheckSatResult = _SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_SOLVER.model(), write, terms=_ALIAS_REPORT_TERMS)
+
+        if not USE_ASSUMPTIONS:
+            _SOLVER.pop()
     # Return True if the constraints are satisfiable for writable va, False otherwise
     return CheckSatResult
 
 
-def is_va_executable_but_alias_nx(va_val, va1_val):
-    s = Solver()
-    s.push()
-    
-    s.add(va == BitVecVal(va_val, 32))
-    s.add(va1 == BitVecVal(va1_val, 32))
-    s.add(Distinct(nx_bits(va1), nx_bits(va)))
-    
-    # Add constraints to the solver
-    s.add(constraint0)
-    s.add(constraint1)
-    s.add(constraint2)
-    s.add(constraint3)
-    s.add(constraint4)
-    s.add(constraint5)
-    s.add(constraint6)
-    s.add(constraint7)
-    s.add(constraint8)
-    s.add(constraint9)
-    s.add(constraint10)
-    s.add(constraint11)
-    s.add(constraint12)
-    s.add(constraint13)
-    s.add(constraint14)
-    s.add(constraint_wx)
-
-    # Check if the constraints are satisfiable for the given va and execute access
-    s.add(execute == True)
-    CheckSatResult = s.check()
-        
-    if CheckSatResult == sat:
-        m = s.model()
-        print("=== execute: ", m.evaluate(execute), " ===")
-        print("ro_bits: ", m.evaluate(ro_bits(va)))
-        print("phy_ro: ", m.evaluate(phy_ro(mmu2(mmu1(va)))))
-        print("nx_bits: ", m.evaluate(nx_bits(va)))
-        print("phy_nx: ", m.evaluate(phy_nx(mmu2(mmu1(va)))))
-
-    s.pop()
+@lru_cache(maxsize=4096)
+def is_va_executable_but_alias_nx(va_val, va1_val, verbose=False):
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            CheckSatResult = _SOLVER.check(*binding(va, va_val),
+                                           *binding(va1, va1_val), p_nx_alias, p_execute)
+        else:
+            _SOLVER.push()
+            _SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+            _SOLVER.add(*binding(va1, va1_val))
+            _SOLVER.add(nx_bits(va1) != nx_bits(va))
+
+            # Check if the constraints are satisfiable for the given va and execute access
+            _SOLVER.add(execute, *_EXEC_RAW)
+            CheckSatResult = _SOLVER.check()
+
+        if verbose and CheckSatResult == sat:
+            _dump(_SOLVER.model(), execute)
+
+        if not USE_ASSUMPTIONS:
+            _SOLVER.pop()
     # Return True if the constraints are satisfiable for executable va, False otherwise
     return CheckSatResult
 
-va_val = BitVecVal(0x12345000, 32).as_long()
-va1_val = BitVecVal(0x23456000, 32).as_long()
-
-if is_writable(va_val) == sat:
-    print("==== write({}) satisfied ====".format(hex(va_val)))
-else:
-    print("write({}) unsatisfied".format(hex(va_val)))
-
-if is_executable(va_val) == sat:
-    print("==== execute({}) satisfied ====".format(hex(va_val)))
-else:
-    print("execute({}) unsatisfied".format(hex(va_val)))
-    
-    
-if is_va_writable_but_alias_read_only(va_val, va1_val) == sat:
-    print("==== va writable & alias read-only({}) satisfied ====".format(hex(va_val)))
-else:
-    print("alias write({}) unsatisfied".format(hex(va_val)))
-
-if is_va_executable_but_alias_nx(va_val, va1_val) == sat:
-    print("==== va executable & alias nx({}) satisfied ====".format(hex(va_val)))
-else:
-    print("alias execute({}) unsatisfied".format(hex(va_val)))
-    
\ No newline at end of file
+
+# Query-specific constraints of the four driver queries, past the va
+# binding: write, execute, and write / execute with an alias va1 whose ro /
+# nx bit differs from va's
+def driver_queries(va1_val):
+    va1_binding = binding(va1, va1_val)
+    return ([write, *_WRITE_RAW],
+            [execute, *_EXEC_RAW],
+            va1_binding + [ro_bits(va1) != ro_bits(va), write, *_WRITE_RAW],
+            va1_binding + [nx_bits(va1) != nx_bits(va), execute, *_EXEC_RAW])
+
+
+# Run the four driver queries in one pass over the W^X solver and return
+# their (writable, executable, alias read-only, alias nx) verdicts. With
+# USE_ASSUMPTIONS each query is one check() over its literals; otherwise
+# the va binding they share is pushed once and each query pushes only its
+# own constraints on top of it.
+def run_queries(va_val, va1_val):
+    results = []
+    with _LOCK:
+        if USE_ASSUMPTIONS:
+            va_binding = binding(va, va_val)
+            va1_binding = binding(va1, va1_val)
+            for assumptions in ([p_write], [p_execute],
+                                va1_binding + [p_ro_alias, p_write],
+                                va1_binding + [p_nx_alias, p_execute]):
+                results.append(_SOLVER.check(*va_binding, *assumptions))
+            return tuple(results)
+
+        _SOLVER.push()
+        _SOLVER.add(va == page_number(va_val), page_aligned(va_val))
+        for query in driver_queries(va1_val):
+            _SOLVER.push()
+            _SOLVER.add(query)
+            results.append(_SOLVER.check())
+            _SOLVER.pop()
+        _SOLVER.pop()
+    return tuple(results)
+
+
+# One-shot queries can also be handed to the z3 command line tool, which
+# runs its full preprocessing on each script instead of the incremental
+# solver's. Each call spawns a process, so it is only used with --z3-cli;
+# without a z3 binary, or an answer it can read, the query runs in-process.
+USE_Z3_CLI = False
+Z3_CLI = shutil.which('z3')
+
+_RESULTS = {'sat': sat, 'unsat': unsat, 'unknown': unknown}
+
+def check_cli(assertions):
+    s = SimpleSolver()
+    s.add(assertions)
+    if Z3_CLI is not None:
+        proc = subprocess.run([Z3_CLI, '-smt2', '-in'], input=s.to_smt2(),
+                              capture_output=True, text=True)
+        answer = proc.stdout.strip()
+        if proc.returncode == 0 and answer in _RESULTS:
+            return _RESULTS[answer]
+    return s.check()
+
+
+# The driver queries as one-shot z3 scripts, one per query
+def run_queries_cli(va_val, va1_val):
+    va_binding = [va == page_number(va_val), page_aligned(va_val)]
+    return tuple(check_cli(_THEORY + va_binding + query) for query in driver_queries(va1_val))
+
+
+# The driver queries are independent, so they can also be checked in a
+# pool of worker processes, one query per worker. z3 objects cannot be
+# pickled: a worker gets the addresses and the query index, checks the
+# query on a solver of its own and sends back the verdict's name. Starting
+# the pool costs more than these small checks, so it is only used with
+# --processes.
+USE_PROCESSES = False
+
+def _check_driver_query(args):
+    va_val, va1_val, index = args
+    s = SimpleSolver()
+    s.set(**_SMT_PARAMS)
+    s.add(_THEORY)
+    s.add(va == page_number(va_val), page_aligned(va_val))
+    s.add(driver_queries(va1_val)[index])
+    return str(s.check())
+
+
+def run_queries_parallel(va_val, va1_val):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        answers = pool.map(_check_driver_query, [(va_val, va1_val, i) for i in range(4)])
+        return tuple(_RESULTS[answer] for answer in answers)
+
+
+if __name__ == "__main__":
+    USE_Z3_CLI = '--z3-cli' in sys.argv
+    USE_PROCESSES = '--processes' in sys.argv
+    va_val = 0x12345000
+    va1_val = 0x23456000
+
+    if USE_Z3_CLI:
+        writable, executable, alias_read_only, alias_nx = run_queries_cli(va_val, va1_val)
+    elif USE_PROCESSES:
+        writable, executable, alias_read_only, alias_nx = run_queries_parallel(va_val, va1_val)
+    else:
+        writable, executable, alias_read_only, alias_nx = run_queries(va_val, va1_val)
+
+    if writable == sat:
+        print("==== write({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("write({}) unsatisfied".format(hex(va_val)))
+
+    if executable == sat:
+        print("==== execute({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("execute({}) unsatisfied".format(hex(va_val)))
+
+
+    if alias_read_only == sat:
+        print("==== va writable & alias read-only({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("alias write({}) unsatisfied".format(hex(va_val)))
+
+    if alias_nx == sat:
+        print("==== va executable & alias nx({}) satisfied ====".format(hex(va_val)))
+    else:
+        print("alias execute({}) unsatisfied".format(hex(va_val)))